@@ -1,23 +1,71 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import List
 from dotenv import load_dotenv
 
-load_dotenv()
-
 # Base directory - backend folder
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Model configuration - model is now in backend folder
 DEFAULT_MODEL_PATH = BASE_DIR / "runs_detect_id_card_yolo11m_75epochs_weights_best.pt"
-MODEL_PATH = os.getenv("MODEL_PATH", str(DEFAULT_MODEL_PATH))
 
-# Server configuration
-HOST = os.getenv("HOST", "0.0.0.0")
-PORT = int(os.getenv("PORT", 8000))
 
-# CORS configuration
-CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+@dataclass(frozen=True)
+class Settings:
+    """Application settings, read from the environment once per process"""
+    MODEL_PATH: str
+
+    # Server configuration
+    HOST: str
+    PORT: int
+
+    # CORS configuration
+    CORS_ORIGINS: List[str]
+
+    # Detection configuration
+    CONFIDENCE_THRESHOLD: float
+    IOU_THRESHOLD: float
+
+    # Micro-batching: concurrent requests arriving within BATCH_MAX_WAIT_MS
+    # of each other share one forward pass of up to BATCH_MAX_SIZE images
+    BATCH_MAX_SIZE: int
+    BATCH_MAX_WAIT_MS: float
+
+    # PyTorch intra-op threads; 0 keeps PyTorch's default (one per physical core)
+    TORCH_NUM_THREADS: int
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings, reading .env unless the environment is already exported"""
+    # Deployments that export every variable can set SETTINGS_CACHED=1 to skip .env
+    if os.getenv("SETTINGS_CACHED") != "1":
+        load_dotenv()
+
+    return Settings(
+        MODEL_PATH=os.getenv("MODEL_PATH", str(DEFAULT_MODEL_PATH)),
+        HOST=os.getenv("HOST", "0.0.0.0"),
+        PORT=int(os.getenv("PORT", 8000)),
+        CORS_ORIGINS=os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(","),
+        CONFIDENCE_THRESHOLD=float(os.getenv("CONFIDENCE_THRESHOLD", 0.5)),
+        IOU_THRESHOLD=float(os.getenv("IOU_THRESHOLD", 0.45)),
+        BATCH_MAX_SIZE=int(os.getenv("BATCH_MAX_SIZE", 8)),
+        BATCH_MAX_WAIT_MS=float(os.getenv("BATCH_MAX_WAIT_MS", 5)),
+        TORCH_NUM_THREADS=int(os.getenv("TORCH_NUM_THREADS", 0))
+    )
+
+
+settings = get_settings()
 
-# Detection configuration
-CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.5))
-IOU_THRESHOLD = float(os.getenv("IOU_THRESHOLD", 0.45))
+# Module-level names kept for existing imports
+MODEL_PATH = settings.MODEL_PATH
+HOST = settings.HOST
+PORT = settings.PORT
+CORS_ORIGINS = settings.CORS_ORIGINS
+CONFIDENCE_THRESHOLD = settings.CONFIDENCE_THRESHOLD
+IOU_THRESHOLD = settings.IOU_THRESHOLD
+BATCH_MAX_SIZE = settings.BATCH_MAX_SIZE
+BATCH_MAX_WAIT_MS = settings.BATCH_MAX_WAIT_MS
+TORCH_NUM_THREADS = settings.TORCH_NUM_THREADS
@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from pathlib import Path
 
 # Get base directory
@@ -11,9 +12,30 @@ SQLALCHEMY_DATABASE_URL = f"sqlite:///{BASE_DIR}/detection_records.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Needed for SQLite
+    connect_args={"check_same_thread": False},  # Needed for SQLite
+    poolclass=QueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+    """Tune every new SQLite connection.
+
+    WAL lets analytics reads proceed while a detection is being written,
+    and synchronous=NORMAL is durable under WAL with far fewer fsyncs.
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -29,6 +51,30 @@ def get_db():
 
 
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and apply pending migrations"""
     from . import db_models  # Import models to register them
-    Base.metadata.create_all(bind=engine)
+    from .migrations import run_migrations
+    
+    # pysqlite doesn't put DDL inside its transactions, so manage the transaction
+    # ourselves: BEGIN IMMEDIATE takes the write lock up front, schema changes
+    # commit or roll back together, and workers starting at the same time wait
+    # here and then see the migrated schema instead of migrating it twice
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Wait longer than usual for another worker's migration, but put the
+        # connection back into the pool with pysqlite's default 5 s timeout
+        conn.exec_driver_sql("PRAGMA busy_timeout = 60000")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                fresh = not inspect(conn).has_table(db_models.DailyStats.__tablename__)
+                Base.metadata.create_all(bind=conn)
+                run_migrations(conn, fresh=fresh)
+                conn.exec_driver_sql("COMMIT")
+            except Exception:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+        finally:
+            conn.exec_driver_sql("PRAGMA busy_timeout = 5000")
+        
+        # Refresh query planner statistics where SQLite thinks it is worthwhile
+        conn.exec_driver_sql("PRAGMA optimize")
@@ -1,42 +1,50 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, func
+from sqlalchemy import Column, Integer, String, DateTime, Date, Index, func, text
 from sqlalchemy.sql import expression
-from datetime import datetime, date
 from .database import Base
 
 
 class DetectionRecord(Base):
     """
     Stores individual detection events.
-    Each row = one detection API call with counts per class.
+    Each row = one detection API call with counts per class;
+    the total is derived on read as the sum of the class counts.
     """
     __tablename__ = "detection_records"
 
     id = Column(Integer, primary_key=True, index=True)
     
-    # Timestamp of detection
-    detected_at = Column(DateTime, default=datetime.utcnow, index=True)
-    date = Column(Date, default=date.today, index=True)
+    # Timestamp of detection, stamped by SQLite: UTC time and local date
+    detected_at = Column(DateTime, server_default=func.now(), index=True)
+    date = Column(Date, server_default=text("(date('now', 'localtime'))"), index=True)
     
     # Counts per class for this detection
     admin_count = Column(Integer, default=0)
     student_count = Column(Integer, default=0)
     teacher_count = Column(Integer, default=0)
-    total_count = Column(Integer, default=0)
     
     # Detection metadata
     source = Column(String, default="upload")  # 'upload' or 'webcam'
     inference_time_ms = Column(Integer, default=0)
     
     def __repr__(self):
-        return f"<DetectionRecord {self.id}: {self.total_count} detections at {self.detected_at}>"
+        total_count = self.admin_count + self.student_count + self.teacher_count
+        return f"<DetectionRecord {self.id}: {total_count} detections at {self.detected_at}>"
 
 
 class DailyStats(Base):
     """
     Aggregated daily statistics.
-    Updated after each detection for quick querying.
+    Upserted after each batch of detections for quick querying.
     """
     __tablename__ = "daily_stats"
+    __table_args__ = (
+        # Covering index so period aggregates are answered from the index alone
+        Index(
+            "ix_daily_stats_covering",
+            "date", "admin_count", "student_count", "teacher_count",
+            "total_detections", "request_count", "total_inference_time_ms"
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, unique=True, index=True)
@@ -50,12 +58,12 @@ class DailyStats(Base):
     # Number of detection requests
     request_count = Column(Integer, default=0)
     
-    # Average inference time
-    avg_inference_time_ms = Column(Integer, default=0)
+    # Sum of inference times; the average is derived on read
+    total_inference_time_ms = Column(Integer, default=0)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     def __repr__(self):
         return f"<DailyStats {self.date}: {self.total_detections} total>"
@@ -1,12 +1,18 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query
+import asyncio
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from datetime import date
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Literal, Optional
 
 from app.config import CORS_ORIGINS, MODEL_PATH
-from app.models.schemas import DetectionResponse, Base64ImageRequest, HealthResponse
-from app.services.detector import detector
+from app.models.schemas import (
+    DetectionResponse, Base64ImageRequest, HealthResponse,
+    PeriodStatsResponse, DailyBreakdownResponse, ClassDistributionResponse,
+    RecentDetectionsResponse, TodayStatsResponse
+)
+from app.services.detector import detector, batcher
 from app.database import get_db, init_db
 from app.services.analytics import AnalyticsService
 
@@ -22,9 +28,20 @@ async def lifespan(app: FastAPI):
     
     if not detector.load_model():
         print("WARNING: Failed to load model. Detection endpoints will not work.")
+    
+    # Start the inference batcher and the writer that batches detection records
+    batcher_task = asyncio.create_task(batcher.run())
+    writer_task = asyncio.create_task(AnalyticsService.run_writer())
     yield
     # Shutdown
     print("Shutting down ID Card Detection API...")
+    for task in (batcher_task, writer_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    AnalyticsService.flush_pending()
 
 
 app = FastAPI(
@@ -66,8 +83,8 @@ async def health_check():
 
 @app.post("/detect", response_model=DetectionResponse, tags=["Detection"])
 async def detect_from_file(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...)
 ):
     """
     Detect ID cards from uploaded image file
@@ -90,15 +107,15 @@ async def detect_from_file(
         raise HTTPException(status_code=400, detail="Empty file")
     
     # Run detection
-    result = detector.detect_from_bytes(contents)
+    result = await detector.detect_from_bytes(contents)
     
     if not result.success:
         raise HTTPException(status_code=500, detail=result.message)
     
     # Record detection analytics
     if result.detections:
-        AnalyticsService.record_detection(
-            db=db,
+        background_tasks.add_task(
+            AnalyticsService.record_detection,
             detections=[d.model_dump() for d in result.detections],
             inference_time_ms=result.inference_time_ms,
             source="upload"
@@ -110,7 +127,7 @@ async def detect_from_file(
 @app.post("/detect/base64", response_model=DetectionResponse, tags=["Detection"])
 async def detect_from_base64(
     request: Base64ImageRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks
 ):
     """
     Detect ID cards from base64 encoded image
@@ -126,15 +143,15 @@ async def detect_from_base64(
         raise HTTPException(status_code=400, detail="Image data required")
     
     # Run detection
-    result = detector.detect_from_base64(request.image)
+    result = await detector.detect_from_base64(request.image)
     
     if not result.success:
         raise HTTPException(status_code=500, detail=result.message)
     
     # Record detection analytics
     if result.detections:
-        AnalyticsService.record_detection(
-            db=db,
+        background_tasks.add_task(
+            AnalyticsService.record_detection,
             detections=[d.model_dump() for d in result.detections],
             inference_time_ms=result.inference_time_ms,
             source="webcam"
@@ -143,9 +160,51 @@ async def detect_from_base64(
     return result
 
 
+@app.post("/detect/raw", response_model=DetectionResponse, tags=["Detection"])
+async def detect_from_raw(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    source: Literal["upload", "webcam"] = Query("upload", description="Image source recorded in analytics")
+):
+    """
+    Detect ID cards from raw image bytes sent as the request body
+    
+    - **body**: Image bytes (JPEG, PNG, etc.), e.g. with Content-Type application/octet-stream
+    - **source**: 'upload' or 'webcam', recorded in analytics
+    
+    Used by the webcam client to avoid base64 encoding each frame.
+    Returns detection results with bounding boxes and confidence scores
+    """
+    if not detector.is_loaded():
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    contents = await request.body()
+    
+    if len(contents) == 0:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    
+    # Run detection
+    result = await detector.detect_from_bytes(contents)
+    
+    if not result.success:
+        raise HTTPException(status_code=500, detail=result.message)
+    
+    # Record detection analytics
+    if result.detections:
+        background_tasks.add_task(
+            AnalyticsService.record_detection,
+            detections=[d.model_dump() for d in result.detections],
+            inference_time_ms=result.inference_time_ms,
+            source=source
+        )
+    
+    return result
+
+
 # ==================== ANALYTICS ENDPOINTS ====================
 
-@app.get("/analytics/stats", tags=["Analytics"])
+
+@app.get("/analytics/stats", response_model=PeriodStatsResponse, tags=["Analytics"])
 async def get_stats(
     period: str = Query("week", description="Period: today, week, month, year, all"),
     db: Session = Depends(get_db)
@@ -165,7 +224,7 @@ async def get_stats(
     return AnalyticsService.get_stats_by_period(db, period)
 
 
-@app.get("/analytics/daily", tags=["Analytics"])
+@app.get("/analytics/daily", response_model=DailyBreakdownResponse, tags=["Analytics"])
 async def get_daily_breakdown(
     days: int = Query(7, ge=1, le=365, description="Number of days"),
     db: Session = Depends(get_db)
@@ -181,7 +240,7 @@ async def get_daily_breakdown(
     }
 
 
-@app.get("/analytics/distribution", tags=["Analytics"])
+@app.get("/analytics/distribution", response_model=ClassDistributionResponse, tags=["Analytics"])
 async def get_class_distribution(db: Session = Depends(get_db)):
     """
     Get overall class distribution (admin, student, teacher percentages).
@@ -189,7 +248,7 @@ async def get_class_distribution(db: Session = Depends(get_db)):
     return AnalyticsService.get_class_distribution(db)
 
 
-@app.get("/analytics/recent", tags=["Analytics"])
+@app.get("/analytics/recent", response_model=RecentDetectionsResponse, tags=["Analytics"])
 async def get_recent_detections(
     limit: int = Query(10, ge=1, le=100, description="Number of records"),
     db: Session = Depends(get_db)
@@ -205,7 +264,7 @@ async def get_recent_detections(
     }
 
 
-@app.get("/analytics/today", tags=["Analytics"])
+@app.get("/analytics/today", response_model=TodayStatsResponse, tags=["Analytics"])
 async def get_today_stats(db: Session = Depends(get_db)):
     """
     Get today's detection statistics.
@@ -230,9 +289,6 @@ async def get_today_stats(db: Session = Depends(get_db)):
         "teacher_count": stats.teacher_count,
         "total_detections": stats.total_detections,
         "request_count": stats.request_count,
-        "avg_inference_time_ms": stats.avg_inference_time_ms
+        "avg_inference_time_ms": round(stats.avg_inference_time_ms or 0, 2)
     }
 
-
-# Import date for today endpoint
-from datetime import date
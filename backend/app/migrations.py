@@ -0,0 +1,94 @@
+"""
+Schema migrations for existing SQLite databases.
+
+create_all() only creates missing tables, so changes to tables that already
+exist are applied here. Each migration runs once; the number applied is kept
+in SQLite's PRAGMA user_version.
+"""
+from sqlalchemy import MetaData, Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+
+def _store_total_inference_time(conn: Connection):
+    """Replace daily_stats.avg_inference_time_ms with a running total"""
+    conn.exec_driver_sql(
+        "ALTER TABLE daily_stats ADD COLUMN total_inference_time_ms INTEGER DEFAULT 0"
+    )
+    conn.exec_driver_sql(
+        "UPDATE daily_stats SET total_inference_time_ms = "
+        "COALESCE(avg_inference_time_ms, 0) * COALESCE(request_count, 0)"
+    )
+    conn.exec_driver_sql("ALTER TABLE daily_stats DROP COLUMN avg_inference_time_ms")
+
+
+def _add_daily_stats_covering_index(conn: Connection):
+    """Add a covering index for daily_stats range aggregates"""
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_daily_stats_covering ON daily_stats "
+        "(date, admin_count, student_count, teacher_count, "
+        "total_detections, request_count, total_inference_time_ms)"
+    )
+    conn.exec_driver_sql("ANALYZE")
+
+
+def _drop_detection_total_count(conn: Connection):
+    """Drop detection_records.total_count, which is derived on read"""
+    conn.exec_driver_sql("ALTER TABLE detection_records DROP COLUMN total_count")
+
+
+def _rebuild_table(conn: Connection, table: Table):
+    """Recreate a table from its model definition, keeping its rows (SQLite can't alter columns in place)"""
+    new_name = f"{table.name}_new"
+    new_table = table.to_metadata(MetaData(), name=new_name)
+    
+    old_columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+    columns = ", ".join(c.name for c in table.columns if c.name in old_columns)
+    
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {new_name}")
+    conn.execute(CreateTable(new_table))  # Indexes are created after the rename
+    conn.exec_driver_sql(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}")
+    conn.exec_driver_sql(f"DROP TABLE {table.name}")  # Also drops its indexes
+    conn.exec_driver_sql(f"ALTER TABLE {new_name} RENAME TO {table.name}")
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _use_server_side_timestamps(conn: Connection):
+    """Let SQLite stamp detection and daily stats timestamps"""
+    from .db_models import DetectionRecord, DailyStats
+    
+    _rebuild_table(conn, DetectionRecord.__table__)
+    _rebuild_table(conn, DailyStats.__table__)
+
+
+# Append only - the position of a migration is its schema version
+MIGRATIONS = [
+    _store_total_inference_time,
+    _add_daily_stats_covering_index,
+    _drop_detection_total_count,
+    _use_server_side_timestamps,
+]
+
+
+def run_migrations(conn: Connection, fresh: bool = False):
+    """
+    Apply pending migrations.
+    
+    Must run inside a write transaction (see init_db) so that the version read
+    here cannot change before the migrations and version bump are committed.
+    
+    Args:
+        conn: Connection holding the database write lock
+        fresh: True if the tables were just created at the latest schema
+    """
+    if fresh:
+        version = len(MIGRATIONS)
+    else:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    
+    for migration in MIGRATIONS[version:]:
+        print(f"Applying migration: {migration.__doc__}")
+        migration(conn)
+    
+    conn.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS)}")
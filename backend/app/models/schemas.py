@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -38,3 +39,75 @@ class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
     model_path: str
+
+
+class PeriodStatsResponse(BaseModel):
+    """Aggregated detection statistics for a time period"""
+    period: str
+    start_date: str
+    end_date: str
+    admin_count: int
+    student_count: int
+    teacher_count: int
+    total_detections: int
+    request_count: int
+    avg_inference_time_ms: float
+
+
+class DailyStatsEntry(BaseModel):
+    """Detection counts for a single day"""
+    date: str
+    admin_count: int
+    student_count: int
+    teacher_count: int
+    total_detections: int
+    request_count: int
+
+
+class DailyBreakdownResponse(BaseModel):
+    """Daily breakdown of detections"""
+    days: int
+    data: List[DailyStatsEntry]
+
+
+class TodayStatsResponse(BaseModel):
+    """Today's detection statistics"""
+    date: str
+    admin_count: int
+    student_count: int
+    teacher_count: int
+    total_detections: int
+    request_count: int
+    avg_inference_time_ms: float
+
+
+class ClassShare(BaseModel):
+    """Count and percentage of detections for one class"""
+    count: int
+    percentage: float
+
+
+class ClassDistributionResponse(BaseModel):
+    """Overall class distribution"""
+    admin: ClassShare
+    student: ClassShare
+    teacher: ClassShare
+    total: int
+
+
+class DetectionRecordEntry(BaseModel):
+    """A single stored detection record"""
+    id: int
+    detected_at: datetime
+    admin_count: int
+    student_count: int
+    teacher_count: int
+    total_count: int
+    source: str
+    inference_time_ms: int
+
+
+class RecentDetectionsResponse(BaseModel):
+    """Most recent detection records"""
+    limit: int
+    records: List[DetectionRecordEntry]
@@ -1,57 +1,138 @@
+import asyncio
+from collections import Counter
+from threading import Lock
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from datetime import datetime, date, timedelta
+from sqlalchemy import func, desc, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Row
+from datetime import date, timedelta
 from typing import Dict, List, Optional
+from ..database import SessionLocal
 from ..db_models import DetectionRecord, DailyStats
 
 
+# Background writer batching: flush after this many records or this many seconds
+WRITER_BATCH_SIZE = 100
+WRITER_MAX_WAIT_S = 0.2
+
+# Detection records waiting to be written by AnalyticsService.run_writer
+detection_queue: "asyncio.Queue[Dict]" = asyncio.Queue()
+
+
 class AnalyticsService:
     """Service for recording and querying detection analytics"""
     
+    # Short TTL cache for aggregate queries, shared by all requests in this
+    # process and cleared whenever a batch of detections is written
+    _cache = TTLCache(maxsize=16, ttl=5)
+    _cache_lock = Lock()
+    
     @staticmethod
-    def record_detection(
-        db: Session,
+    async def record_detection(
         detections: List[Dict],
         inference_time_ms: float,
         source: str = "upload"
-    ) -> DetectionRecord:
+    ) -> None:
         """
-        Record a detection event and update daily stats.
+        Queue a detection event for the background writer.
         
         Args:
-            db: Database session
-            detections: List of detection results with class_name
+            detections: List of detection results with lower-case class_name
             inference_time_ms: Time taken for inference
             source: 'upload' or 'webcam'
         """
-        # Count detections by class
-        admin_count = sum(1 for d in detections if d.get('class_name', '').lower() == 'admin')
-        student_count = sum(1 for d in detections if d.get('class_name', '').lower() == 'student')
-        teacher_count = sum(1 for d in detections if d.get('class_name', '').lower() == 'teacher')
-        total_count = len(detections)
-        
-        # Create detection record
-        record = DetectionRecord(
-            detected_at=datetime.utcnow(),
-            date=date.today(),
-            admin_count=admin_count,
-            student_count=student_count,
-            teacher_count=teacher_count,
-            total_count=total_count,
-            source=source,
-            inference_time_ms=int(inference_time_ms)
-        )
-        db.add(record)
+        # Count detections by class in a single pass
+        counts = Counter(d.get('class_name', '') for d in detections)
         
-        # Update daily stats
-        AnalyticsService._update_daily_stats(
-            db, admin_count, student_count, teacher_count, 
-            total_count, int(inference_time_ms)
-        )
+        # detected_at and date are stamped by SQLite when the batch is written
+        detection_queue.put_nowait({
+            "admin_count": counts['admin'],
+            "student_count": counts['student'],
+            "teacher_count": counts['teacher'],
+            "source": source,
+            "inference_time_ms": int(inference_time_ms)
+        })
+    
+    @staticmethod
+    async def run_writer():
+        """
+        Drain the detection queue forever, writing each batch in one transaction.
+        
+        A batch is flushed once it holds WRITER_BATCH_SIZE records or
+        WRITER_MAX_WAIT_S seconds after its first record arrived.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await detection_queue.get()]
+            deadline = loop.time() + WRITER_MAX_WAIT_S
+            
+            try:
+                while len(batch) < WRITER_BATCH_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(detection_queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Hand the records back so flush_pending() still writes them
+                for record in batch:
+                    detection_queue.put_nowait(record)
+                raise
+            
+            try:
+                await asyncio.to_thread(AnalyticsService._write_batch, batch)
+            except Exception as e:
+                print(f"Error writing {len(batch)} detection record(s): {e}")
+    
+    @staticmethod
+    def flush_pending():
+        """Write any records still queued (used on shutdown)"""
+        batch = []
+        while not detection_queue.empty():
+            batch.append(detection_queue.get_nowait())
+        
+        if batch:
+            AnalyticsService._write_batch(batch)
+    
+    @staticmethod
+    def _write_batch(batch: List[Dict]):
+        """Insert a batch of detection records and update daily stats in one commit"""
+        db = SessionLocal()
+        try:
+            # Core executemany insert, no ORM objects or post-insert refresh
+            db.execute(insert(DetectionRecord), batch)
+            
+            # Sum the batch so today's stats row is touched once
+            totals = {
+                "admin_count": 0,
+                "student_count": 0,
+                "teacher_count": 0,
+                "total_count": 0,
+                "request_count": 0,
+                "inference_time_ms": 0
+            }
+            for record in batch:
+                totals["admin_count"] += record["admin_count"]
+                totals["student_count"] += record["student_count"]
+                totals["teacher_count"] += record["teacher_count"]
+                totals["total_count"] += (
+                    record["admin_count"] + record["student_count"] + record["teacher_count"]
+                )
+                totals["request_count"] += 1
+                totals["inference_time_ms"] += record["inference_time_ms"]
+            
+            AnalyticsService._update_daily_stats(db, **totals)
+            
+            db.commit()
+        finally:
+            db.close()
         
-        db.commit()
-        db.refresh(record)
-        return record
+        with AnalyticsService._cache_lock:
+            AnalyticsService._cache.clear()
     
     @staticmethod
     def _update_daily_stats(
@@ -60,45 +141,50 @@ class AnalyticsService:
         student_count: int,
         teacher_count: int,
         total_count: int,
+        request_count: int,
         inference_time_ms: int
     ):
-        """Update or create daily stats record"""
-        today = date.today()
-        
-        daily_stats = db.query(DailyStats).filter(DailyStats.date == today).first()
-        
-        if daily_stats:
-            # Update existing record
-            daily_stats.admin_count += admin_count
-            daily_stats.student_count += student_count
-            daily_stats.teacher_count += teacher_count
-            daily_stats.total_detections += total_count
-            daily_stats.request_count += 1
-            
-            # Calculate running average of inference time
-            total_requests = daily_stats.request_count
-            daily_stats.avg_inference_time_ms = int(
-                (daily_stats.avg_inference_time_ms * (total_requests - 1) + inference_time_ms) / total_requests
-            )
-        else:
-            # Create new record for today
-            daily_stats = DailyStats(
-                date=today,
-                admin_count=admin_count,
-                student_count=student_count,
-                teacher_count=teacher_count,
-                total_detections=total_count,
-                request_count=1,
-                avg_inference_time_ms=inference_time_ms
-            )
-            db.add(daily_stats)
+        """Add counts to today's daily stats record in a single upsert"""
+        stmt = insert(DailyStats).values(
+            # Same local date SQLite stamps on the detection records
+            date=func.date('now', 'localtime'),
+            admin_count=admin_count,
+            student_count=student_count,
+            teacher_count=teacher_count,
+            total_detections=total_count,
+            request_count=request_count,
+            total_inference_time_ms=inference_time_ms
+        ).on_conflict_do_update(
+            index_elements=[DailyStats.date],
+            set_={
+                "admin_count": DailyStats.admin_count + admin_count,
+                "student_count": DailyStats.student_count + student_count,
+                "teacher_count": DailyStats.teacher_count + teacher_count,
+                "total_detections": DailyStats.total_detections + total_count,
+                "request_count": DailyStats.request_count + request_count,
+                "total_inference_time_ms": DailyStats.total_inference_time_ms + inference_time_ms,
+                "updated_at": func.now()
+            }
+        )
+        db.execute(stmt)
     
     @staticmethod
-    def get_today_stats(db: Session) -> Optional[DailyStats]:
+    def get_today_stats(db: Session) -> Optional[Row]:
         """Get today's statistics"""
-        return db.query(DailyStats).filter(DailyStats.date == date.today()).first()
+        return db.query(
+            DailyStats.date,
+            DailyStats.admin_count,
+            DailyStats.student_count,
+            DailyStats.teacher_count,
+            DailyStats.total_detections,
+            DailyStats.request_count,
+            (
+                DailyStats.total_inference_time_ms / func.nullif(DailyStats.request_count, 0)
+            ).label('avg_inference_time_ms')
+        ).filter(DailyStats.date == date.today()).first()
     
     @staticmethod
+    @cached(_cache, key=lambda db, period="week": hashkey("stats", period), lock=_cache_lock)
     def get_stats_by_period(
         db: Session,
         period: str = "week"
@@ -128,7 +214,10 @@ class AnalyticsService:
             func.sum(DailyStats.teacher_count).label('teacher_count'),
             func.sum(DailyStats.total_detections).label('total_detections'),
             func.sum(DailyStats.request_count).label('request_count'),
-            func.avg(DailyStats.avg_inference_time_ms).label('avg_inference_time')
+            (
+                func.sum(DailyStats.total_inference_time_ms) /
+                func.nullif(func.sum(DailyStats.request_count), 0)
+            ).label('avg_inference_time')
         ).filter(DailyStats.date >= start_date).first()
         
         return {
@@ -151,27 +240,24 @@ class AnalyticsService:
         """Get daily breakdown for the last N days"""
         start_date = date.today() - timedelta(days=days - 1)
         
-        records = db.query(DailyStats).filter(
-            DailyStats.date >= start_date
-        ).order_by(DailyStats.date.asc()).all()
+        stmt = select(
+            DailyStats.date,
+            DailyStats.admin_count,
+            DailyStats.student_count,
+            DailyStats.teacher_count,
+            DailyStats.total_detections,
+            DailyStats.request_count
+        ).where(DailyStats.date >= start_date)
         
         # Create a dict for quick lookup
-        stats_by_date = {r.date: r for r in records}
+        stats_by_date = {r["date"]: r for r in db.execute(stmt).mappings()}
         
         # Fill in missing days with zeros
         result = []
         for i in range(days):
             current_date = start_date + timedelta(days=i)
             if current_date in stats_by_date:
-                r = stats_by_date[current_date]
-                result.append({
-                    "date": current_date.isoformat(),
-                    "admin_count": r.admin_count,
-                    "student_count": r.student_count,
-                    "teacher_count": r.teacher_count,
-                    "total_detections": r.total_detections,
-                    "request_count": r.request_count
-                })
+                result.append({**stats_by_date[current_date], "date": current_date.isoformat()})
             else:
                 result.append({
                     "date": current_date.isoformat(),
@@ -185,6 +271,7 @@ class AnalyticsService:
         return result
     
     @staticmethod
+    @cached(_cache, key=lambda db: hashkey("distribution"), lock=_cache_lock)
     def get_class_distribution(db: Session) -> Dict:
         """Get overall class distribution percentages"""
         stats = db.query(
@@ -226,20 +313,23 @@ class AnalyticsService:
         limit: int = 10
     ) -> List[Dict]:
         """Get recent detection records"""
-        records = db.query(DetectionRecord).order_by(
-            desc(DetectionRecord.detected_at)
-        ).limit(limit).all()
-        
-        return [
-            {
-                "id": r.id,
-                "detected_at": r.detected_at.isoformat(),
-                "admin_count": r.admin_count,
-                "student_count": r.student_count,
-                "teacher_count": r.teacher_count,
-                "total_count": r.total_count,
-                "source": r.source,
-                "inference_time_ms": r.inference_time_ms
-            }
-            for r in records
-        ]
+        # Plain rows instead of ORM objects; detected_at is serialized by FastAPI
+        stmt = select(
+            DetectionRecord.id,
+            DetectionRecord.detected_at,
+            DetectionRecord.admin_count,
+            DetectionRecord.student_count,
+            DetectionRecord.teacher_count,
+            (
+                DetectionRecord.admin_count +
+                DetectionRecord.student_count +
+                DetectionRecord.teacher_count
+            ).label("total_count"),
+            DetectionRecord.source,
+            DetectionRecord.inference_time_ms
+        ).order_by(
+            # detected_at has one-second resolution, so break ties by insertion order
+            desc(DetectionRecord.detected_at), desc(DetectionRecord.id)
+        ).limit(limit)
+        
+        return [dict(r) for r in db.execute(stmt).mappings()]
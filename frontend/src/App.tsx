@@ -8,7 +8,7 @@ import ResultsPanel from './components/ResultsPanel';
 import LoadingSpinner from './components/LoadingSpinner';
 import AnalyticsDashboard from './components/AnalyticsDashboard';
 import { Detection, DetectionMode } from './types/detection';
-import { checkHealth, detectFromFile, detectFromBase64 } from './services/api';
+import { checkHealth, detectFromFile, detectFromBlob } from './services/api';
 import { Upload, Camera, AlertCircle, X, Sparkles, BarChart3 } from 'lucide-react';
 
 // Particle background component - reduced count for mobile performance
@@ -53,6 +53,15 @@ function App() {
   const [imageWidth, setImageWidth] = useState(0);
   const [imageHeight, setImageHeight] = useState(0);
 
+  // Release object URLs created for webcam frames once they are replaced
+  useEffect(() => {
+    return () => {
+      if (imageSrc?.startsWith('blob:')) {
+        URL.revokeObjectURL(imageSrc);
+      }
+    };
+  }, [imageSrc]);
+
   // Check API health on mount
   useEffect(() => {
     const checkApiHealth = async () => {
@@ -106,13 +115,13 @@ function App() {
   }, []);
 
   // Handle webcam capture detection
-  const handleWebcamCapture = useCallback(async (base64Image: string) => {
+  const handleWebcamCapture = useCallback(async (imageBlob: Blob) => {
     setIsLoading(true);
     setError(null);
-    setImageSrc(base64Image);
+    setImageSrc(URL.createObjectURL(imageBlob));
 
     try {
-      const result = await detectFromBase64(base64Image);
+      const result = await detectFromBlob(imageBlob, 'webcam');
 
       if (result.success) {
         setDetections(result.detections);
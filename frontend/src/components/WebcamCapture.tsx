@@ -4,7 +4,7 @@ import Webcam from 'react-webcam';
 import { Camera, CameraOff, RefreshCw, Play, Pause, Zap } from 'lucide-react';
 
 interface WebcamCaptureProps {
-  onCapture: (imageSrc: string) => void;
+  onCapture: (image: Blob) => void;
   isLoading: boolean;
   isAutoCapture: boolean;
   onToggleAutoCapture: () => void;
@@ -37,10 +37,13 @@ const WebcamCapture: React.FC<WebcamCaptureProps> = ({
   const capture = useCallback(() => {
     if (webcamRef.current) {
       setIsCapturing(true);
-      const imageSrc = webcamRef.current.getScreenshot();
-      if (imageSrc) {
-        onCapture(imageSrc);
-      }
+      // Encode the frame straight to JPEG bytes, skipping the base64 data URL
+      const canvas = webcamRef.current.getCanvas();
+      canvas?.toBlob((blob) => {
+        if (blob) {
+          onCapture(blob);
+        }
+      }, 'image/jpeg', 0.92);
       setTimeout(() => setIsCapturing(false), 200);
     }
   }, [onCapture]);
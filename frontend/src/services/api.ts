@@ -37,6 +37,21 @@ export const detectFromBase64 = async (base64Image: string): Promise<DetectionRe
   return response.data;
 };
 
+// Detect from raw image bytes (used for webcam frames, avoids base64 encoding)
+export const detectFromBlob = async (
+  image: Blob,
+  source: 'upload' | 'webcam' = 'upload'
+): Promise<DetectionResponse> => {
+  const response = await api.post('/detect/raw', image, {
+    params: { source },
+    headers: {
+      'Content-Type': 'application/octet-stream',
+    },
+  });
+
+  return response.data;
+};
+
 // Analytics Types
 export interface PeriodStats {
   period: string;